@@ -1,69 +1,159 @@
 # app/ecs_control.py
-import time
+import asyncio
+import logging
+import os
 import random
-from typing import Dict, List, Optional, Tuple
-import copy
+import threading
+import time
+import hashlib
+import json
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from itertools import chain
+from operator import itemgetter
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
 
 import boto3
 from botocore.config import Config
 from botocore.exceptions import (
     ClientError,
+    ConnectTimeoutError,
     EndpointConnectionError,
     ConnectionClosedError,
     ReadTimeoutError,
-    WaiterError,
 )
 
 # ---------- Shared boto3 config & clients ----------
 
+# Retries live here only (no per-call-site loops): adaptive mode adds client-side
+# rate limiting on top of jittered exponential backoff for throttling errors.
 _BOTO_CFG = Config(
-    retries={"max_attempts": 12, "mode": "adaptive"},
+    retries={"max_attempts": 5, "mode": "adaptive"},
     connect_timeout=5,
     read_timeout=30,
+    max_pool_connections=50,
+    tcp_keepalive=True,
 )
 
+if os.getenv("BOTO_RETRY_DEBUG"):
+    # make retry storms visible in the service logs
+    boto3.set_stream_logger("botocore.retries", logging.DEBUG)
+
+# One session per process so botocore's loader/credential caches are shared by all clients
+_SESSION = boto3.session.Session()
+_SESSION_LOCK = threading.Lock()  # sessions (unlike clients) are not thread-safe
+
+@lru_cache(maxsize=None)
+def _cached_client(service: str, region: str, pid: int):
+    with _SESSION_LOCK:
+        return _SESSION.client(service, region_name=region, config=_BOTO_CFG)
+
+def client(service: str, region: str):
+    """One client per (service, region) for the process; botocore clients are thread-safe."""
+    # keyed on pid too: a forked worker must not reuse the parent's connection pool
+    return _cached_client(service, region, os.getpid())
+
+def warm_clients(region: str, services: Tuple[str, ...] = ("ecs", "logs", "servicediscovery")) -> None:
+    """
+    Build the cached clients and resolve credentials ahead of time (service model
+    loading + credential chain walk), so the first request doesn't pay for it.
+    """
+    creds = _SESSION.get_credentials()
+    if creds is not None:
+        creds.get_frozen_credentials()
+    for service in services:
+        client(service, region)
+
 def _ecs(region: str):
-    return boto3.client("ecs", region_name=region, config=_BOTO_CFG)
+    return client("ecs", region)
 
 def _logs(region: str):
-    return boto3.client("logs", region_name=region, config=_BOTO_CFG)
+    return client("logs", region)
 
 def _sd(region: str):
-    return boto3.client("servicediscovery", region_name=region, config=_BOTO_CFG)
+    return client("servicediscovery", region)
+
+# Small shared pool for overlapping independent AWS calls (clients are thread-safe)
+_POOL = ThreadPoolExecutor(max_workers=4, thread_name_prefix="ecs-control")
+
+class _DecorrelatedBackoff:
+    """Decorrelated-jitter backoff: each delay is uniform(base, previous * 3), capped."""
+
+    def __init__(self, base: float = 0.8, cap: float = 16.0):
+        self.base, self.cap, self.prev = base, cap, base
+
+    def next_delay(self, max_delay: Optional[float] = None) -> float:
+        self.prev = min(self.cap, random.uniform(self.base, self.prev * 3))
+        return self.prev if max_delay is None else max(0.0, min(self.prev, max_delay))
+
+    def sleep(self, max_delay: Optional[float] = None) -> None:
+        time.sleep(self.next_delay(max_delay))
+
+_TRANSIENT_EXCEPTIONS = (
+    EndpointConnectionError,
+    ConnectionClosedError,
+    ReadTimeoutError,
+    ConnectTimeoutError,
+)
 
-def _sleep_backoff(attempt: int, base: float = 0.8, cap: float = 16.0):
-    """Exponential backoff with jitter."""
-    delay = min(cap, base * (2 ** attempt)) * (0.5 + random.random())
-    time.sleep(delay)
+_TRANSIENT_CODES = frozenset({
+    "ThrottlingException",
+    "Throttling",
+    "TooManyRequestsException",
+    "RequestLimitExceeded",
+    "RequestThrottled",
+    "ProvisionedThroughputExceededException",
+    "LimitExceededException",
+    "ServiceUnavailableException",
+    "ServiceUnavailable",
+    "Unavailable",
+    "ServerException",
+    "InternalServiceException",
+    "InternalFailure",
+    "InternalError",
+})
 
 def _is_transient(err: Exception) -> bool:
     """Best-effort classification of transient/server-side errors worth retrying."""
-    if isinstance(err, (EndpointConnectionError, ConnectionClosedError, ReadTimeoutError, WaiterError)):
-        return True
-    if isinstance(err, ClientError):
-        code = err.response.get("Error", {}).get("Code", "")
-        return code in {
-            "ThrottlingException",
-            "TooManyRequestsException",
-            "RequestLimitExceeded",
-            "ServiceUnavailableException",
-            "ServerException",
-            "InternalServiceException",
-        }
-    return "Service Unavailable" in str(err)
+    return isinstance(err, _TRANSIENT_EXCEPTIONS) or (
+        isinstance(err, ClientError)
+        and err.response.get("Error", {}).get("Code") in _TRANSIENT_CODES
+    )
 
 # ---------- Utilities ----------
 
+@lru_cache(maxsize=128)
+def _namespace_name(region: str, cloudmap_namespace_id: str) -> str:
+    """Cloud Map namespace name (immutable once created, so cached per process)."""
+    ns = _sd(region).get_namespace(Id=cloudmap_namespace_id)["Namespace"]
+    return ns["Name"]  # e.g., "mobilys-otp-staging.local"
+
 def router_dns_name(region: str, cloudmap_namespace_id: str, service_name: str) -> str:
     """Return 'service.namespace' DNS name for Cloud Map."""
-    sd = _sd(region)
-    ns = sd.get_namespace(Id=cloudmap_namespace_id)["Namespace"]
-    ns_name = ns["Name"]  # e.g., "mobilys-otp-staging.local"
-    return f"{service_name}.{ns_name}"
+    return f"{service_name}.{_namespace_name(region, cloudmap_namespace_id)}"
+
+def _env_pairs(env: Optional[Dict[str, str]]) -> List[Dict[str, str]]:
+    """ECS 'environment' list for an env dict (sorted by name, values as str)."""
+    if not env:
+        return []
+    missing = sorted(k for k, v in env.items() if v is None)
+    if missing:
+        raise ValueError(f"environment values not set: {', '.join(missing)}")
+    # fresh dicts every call: callers (and boto) get lists they may safely mutate
+    return [{"name": k, "value": v if type(v) is str else str(v)} for k, v in sorted(env.items())]
+
+def _spec_hash(spec: dict) -> str:
+    """Stable SHA-256 of a task definition spec (canonical JSON)."""
+    blob = json.dumps(spec, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(blob.encode()).hexdigest()
 
 def _is_taskdef_arn(s: str) -> bool:
     return isinstance(s, str) and s.startswith("arn:aws:ecs:")
 
+# (region, family, specHash) -> ARN of an ACTIVE revision known to match that spec
+_taskdefs_by_spec: Dict[Tuple[str, str, str], str] = {}
+
 def _ensure_taskdef_exists(
     *,
     region: str,
@@ -79,76 +169,229 @@ def _ensure_taskdef_exists(
 ) -> str:
     """
     Make sure an ACTIVE task definition exists for the given family.
-    Returns the ARN of some ACTIVE revision (the latest).
-    Registers once if none exists (requires 'image').
+    Returns the ARN of the revision to run: the one matching this spec, or the
+    latest if it is managed elsewhere. Registers one (requires 'image') if none exists, or if the latest was registered
+    here from a different spec (e.g. a new image). Revisions without a specHash tag
+    are managed elsewhere and used as-is.
     """
+    if not image:
+        raise ValueError(
+            f"No image provided to create a task definition for family '{family}'."
+        )
+
+    reg_kwargs = {
+        "family": family,
+        "networkMode": "awsvpc",
+        "requiresCompatibilities": ["FARGATE"],
+        "cpu": cpu,
+        "memory": memory,
+        "executionRoleArn": exec_role or None,
+        "taskRoleArn": task_role or None,
+        "containerDefinitions": [
+            {
+                "name": container_name,
+                "image": image,
+                "essential": True,
+                "logConfiguration": {
+                    "logDriver": "awslogs",
+                    "options": {
+                        "awslogs-group": log_group,
+                        "awslogs-region": region,
+                        "awslogs-stream-prefix": log_prefix,
+                    },
+                },
+            }
+        ],
+    }
+    reg_kwargs = {k: v for k, v in reg_kwargs.items() if v is not None}
+    spec_hash = _spec_hash(reg_kwargs)
+    key = (region, family, spec_hash)
+    if key in _taskdefs_by_spec:
+        return _taskdefs_by_spec[key]
+
     ecs = _ecs(region)
 
-    # Try to find the latest ACTIVE revision
-    for attempt in range(6):
-        try:
-            resp = ecs.list_task_definitions(
-                familyPrefix=family, status="ACTIVE", sort="DESC", maxResults=1
-            )
-            arns = resp.get("taskDefinitionArns", [])
-            if arns:
-                return arns[0]
-            break
-        except Exception as e:
-            if _is_transient(e) and attempt < 5:
-                _sleep_backoff(attempt)
-                continue
+    # Latest ACTIVE revision of the family, with its tags
+    try:
+        resp = ecs.describe_task_definition(taskDefinition=family, include=["TAGS"])
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") != "ClientException":
             raise
-
-    # None exist: must register one
-    if not image:
-        raise ValueError(
-            f"No ACTIVE task definitions found for family '{family}', and no image provided to create one."
+        resp = None  # family has no ACTIVE revision yet
+    if resp:
+        latest_hash = {t["key"]: t["value"] for t in resp.get("tags", [])}.get("specHash")
+        if latest_hash is None:
+            # managed elsewhere: not cached, so their next revision is picked up
+            return resp["taskDefinition"]["taskDefinitionArn"]
+        if latest_hash == spec_hash:
+            arn = resp["taskDefinition"]["taskDefinitionArn"]
+            _taskdefs_by_spec[key] = arn
+            return arn
+
+    reg_kwargs["tags"] = [{"key": "specHash", "value": spec_hash}]
+    td = ecs.register_task_definition(**reg_kwargs)
+    arn = td["taskDefinition"]["taskDefinitionArn"]
+    _taskdefs_by_spec[key] = arn
+    return arn
+
+_message = itemgetter("message")
+
+def _iter_log_pages_backward(
+    logs, log_group: str, log_stream: str, max_events: int = 400, max_pages: int = 20
+) -> Iterator[List[str]]:
+    """
+    Yield pages of messages from the end of a log stream, newest page first
+    (events within a page stay oldest-first), until 'max_events' have been read.
+    Stops early when CloudWatch echoes back the token we sent, which is how it
+    signals the start of the stream.
+    """
+    token = None
+    remaining = max_events
+    for _ in range(max_pages):
+        kw = dict(
+            logGroupName=log_group,
+            logStreamName=log_stream,
+            startFromHead=False,
+            limit=min(remaining, 10000),
         )
+        if token:
+            kw["nextToken"] = token
+        resp = logs.get_log_events(**kw)
+        page = list(map(_message, resp.get("events", ())))
+        yield page
+        remaining -= len(page)
+        prv = resp.get("nextBackwardToken")
+        if remaining <= 0 or not prv or prv == token:
+            return
+        token = prv
 
-    for attempt in range(6):
-        try:
-            td = ecs.register_task_definition(
-                family=family,
-                networkMode="awsvpc",
-                requiresCompatibilities=["FARGATE"],
-                cpu=cpu,
-                memory=memory,
-                executionRoleArn=exec_role or None,
-                taskRoleArn=task_role or None,
-                containerDefinitions=[
-                    {
-                        "name": container_name,
-                        "image": image,
-                        "essential": True,
-                        "logConfiguration": {
-                            "logDriver": "awslogs",
-                            "options": {
-                                "awslogs-group": log_group,
-                                "awslogs-region": region,
-                                "awslogs-stream-prefix": log_prefix,
-                            },
-                        },
-                    }
-                ],
+_FILTER_SCAN_MAX = 10000  # matching events read by a filtered tail before giving up
+
+def _iter_log_tail(
+    logs,
+    log_group: str,
+    log_stream: str,
+    filter_pattern: Optional[str] = None,
+    max_lines: int = 400,
+    start_time_ms: Optional[int] = None,
+) -> Iterator[str]:
+    """
+    Yield the last 'max_lines' messages of a log stream, oldest first. Nothing is
+    fetched until the iterator is first advanced. With 'filter_pattern', only
+    matching events are returned (filtered server-side), starting at
+    'start_time_ms' when given. CloudWatch can only filter forwards, so the
+    filtered scan stops after the first _FILTER_SCAN_MAX matches: past that, the
+    lines returned are the last of those matches (not the stream's tail),
+    followed by a "[logs] ... truncated" marker line.
+    """
+    lines = deque(maxlen=max_lines)
+    try:
+        if filter_pattern:
+            kw = dict(logGroupName=log_group, logStreamNames=[log_stream], filterPattern=filter_pattern)
+            if start_time_ms is not None:
+                kw["startTime"] = start_time_ms
+            pages = logs.get_paginator("filter_log_events").paginate(
+                **kw, PaginationConfig={"MaxItems": _FILTER_SCAN_MAX, "PageSize": 10000}
             )
-            return td["taskDefinition"]["taskDefinitionArn"]
-        except Exception as e:
-            if _is_transient(e) and attempt < 5:
-                _sleep_backoff(attempt)
-                continue
+            for page in pages:
+                lines.extend(map(_message, page.get("events", ())))
+            if pages.resume_token:
+                lines.append(
+                    f"[logs] filtered scan truncated after {_FILTER_SCAN_MAX} matches; later matches omitted"
+                )
+        else:
+            # Read backwards from the end of the stream until we have enough lines
+            pages = list(_iter_log_pages_backward(logs, log_group, log_stream, max_events=max_lines))
+            for page in reversed(pages):
+                lines.extend(page)
+    except Exception as e:
+        # best-effort: botocore already retried; report instead of failing the build result
+        if not (isinstance(e, ClientError) or _is_transient(e)):
             raise
+        lines.append(f"[logs] unable to fetch: {e}")
+    yield from lines
 
 # ---------- Builder one-off ----------
 
-def submit_builder_and_wait(
+# Builder poll cadence: dense right after launch, tapering to the old fixed waiter delay
+_TASK_POLL_BASE_S, _TASK_POLL_CAP_S = 2.0, 15.0
+
+def _describe_tasks_into(
+    ecs, cluster_arn: str, task_arns: List[str], out: Dict[str, dict], include_tags: bool = False
+) -> None:
+    """One describe_tasks per 100 ARNs (the API maximum); descriptions go into 'out' by ARN."""
+    extra = {"include": ["TAGS"]} if include_tags else {}
+    for i in range(0, len(task_arns), 100):
+        for t in ecs.describe_tasks(cluster=cluster_arn, tasks=task_arns[i:i + 100], **extra)["tasks"]:
+            out[t["taskArn"]] = t
+
+def describe_tasks_bulk(
+    *, region: str, cluster_arn: str, task_arns: Iterable[str], include_tags: bool = False
+) -> Dict[str, dict]:
+    """describe_tasks for any number of ARNs, batched 100 per call. Returns {task_arn: task}."""
+    out: Dict[str, dict] = {}
+    _describe_tasks_into(_ecs(region), cluster_arn, list(dict.fromkeys(task_arns)), out, include_tags)
+    return out
+
+def _poll_tasks(ecs, cluster_arn: str, pending: List[str], latest: Dict[str, dict]) -> List[str]:
+    """Records descriptions in 'latest', returns still-running ARNs."""
+    _describe_tasks_into(ecs, cluster_arn, pending, latest)
+    return [a for a in pending if latest.get(a, {}).get("lastStatus") != "STOPPED"]
+
+def wait_for_tasks_stopped(
+    *,
+    region: str,
+    cluster_arn: str,
+    task_arns: List[str],
+    timeout_s: int = 3 * 60 * 60,
+) -> Dict[str, dict]:
+    """
+    Poll until every task is STOPPED (or 'timeout_s' elapses), using one
+    describe_tasks call per 100 pending tasks per cycle. Polls start around 2s and
+    back off (decorrelated jitter) to 15s. Returns the last description seen for each task ARN.
+    """
+    ecs = _ecs(region)
+    deadline = time.time() + timeout_s
+    backoff = _DecorrelatedBackoff(base=_TASK_POLL_BASE_S, cap=_TASK_POLL_CAP_S)
+    latest: Dict[str, dict] = {}
+    pending = list(dict.fromkeys(task_arns))
+    while True:
+        pending = _poll_tasks(ecs, cluster_arn, pending, latest)
+        if not pending or time.time() >= deadline:
+            return latest
+        backoff.sleep(deadline - time.time())
+
+async def wait_for_tasks_stopped_async(
+    *,
+    region: str,
+    cluster_arn: str,
+    task_arns: List[str],
+    timeout_s: int = 3 * 60 * 60,
+) -> Dict[str, dict]:
+    """
+    Async wait_for_tasks_stopped: a worker thread is only held for each
+    describe_tasks call, and the waits in between are asyncio sleeps, so many
+    builders can be awaited concurrently (asyncio.gather) without a thread each.
+    """
+    ecs = _ecs(region)
+    deadline = time.time() + timeout_s
+    backoff = _DecorrelatedBackoff(base=_TASK_POLL_BASE_S, cap=_TASK_POLL_CAP_S)
+    latest: Dict[str, dict] = {}
+    pending = list(dict.fromkeys(task_arns))
+    while True:
+        pending = await asyncio.to_thread(_poll_tasks, ecs, cluster_arn, pending, latest)
+        if not pending or time.time() >= deadline:
+            return latest
+        await asyncio.sleep(backoff.next_delay(deadline - time.time()))
+
+def _start_builder(
     *,
     region: str,
     cluster_arn: str,
     subnets: List[str],
     security_groups: List[str],
     cloudwatch_log_group: str,
-    task_family: str,                 # family name OR full task definition ARN
+    task_family: str,
     task_exec_role_arn: Optional[str] = None,
     task_role_arn: Optional[str] = None,
     image: Optional[str] = None,
@@ -156,21 +399,17 @@ def submit_builder_and_wait(
     cpu: str = "2048",
     memory: str = "12288",
     stream_prefix: str = "builder",
-) -> Tuple[bool, List[str]]:
-    """
-    Run a one-off builder task and wait for STOPPED. Returns (ok, last_logs_tail).
-    If 'task_family' is a family name, we reuse the latest ACTIVE revision, creating one
-    if the family doesn't exist yet (needs 'image'). If 'task_family' is a full ARN,
-    it's used directly.
-    """
+) -> Tuple[Optional[str], str, List[str]]:
+    """Resolve the TD and run the builder task. Returns (task_arn, log_stream_name, failure_lines)."""
     ecs = _ecs(region)
-    logs = _logs(region)
 
-    # Resolve a usable task definition
-    if _is_taskdef_arn(task_family):
+    # Resolve a usable task definition. Without an image nothing could be registered
+    # anyway, so let run_task resolve the family (and fail if it doesn't exist).
+    if _is_taskdef_arn(task_family) or not image:
         task_def_to_run = task_family
     else:
-        _ensure_taskdef_exists(
+        # run the exact revision matching our spec, not whatever is latest for the family
+        task_def_to_run = _ensure_taskdef_exists(
             region=region,
             family=task_family,
             image=image,
@@ -182,100 +421,303 @@ def submit_builder_and_wait(
             log_group=cloudwatch_log_group,
             log_prefix=stream_prefix,
         )
-        task_def_to_run = task_family   # run by family name uses latest ACTIVE
 
     overrides = {
         "containerOverrides": [
             {
                 "name": "builder",
-                "environment": [{"name": k, "value": str(v)} for k, v in (env or {}).items()],
+                "environment": _env_pairs(env),
             }
         ]
     }
 
-    # Run task (with retries on transient failures)
-    run_resp = None
-    for attempt in range(6):
-        try:
-            run_resp = ecs.run_task(
-                cluster=cluster_arn,
-                launchType="FARGATE",
-                taskDefinition=task_def_to_run,
-                overrides=overrides,
-                networkConfiguration={
-                    "awsvpcConfiguration": {
-                        "subnets": subnets,
-                        "securityGroups": security_groups,
-                        "assignPublicIp": "ENABLED",
-                    }
-                },
-                count=1,
-            )
-            break
-        except Exception as e:
-            if _is_transient(e) and attempt < 5:
-                _sleep_backoff(attempt)
-                continue
-            raise
+    run_resp = ecs.run_task(
+        cluster=cluster_arn,
+        launchType="FARGATE",
+        taskDefinition=task_def_to_run,
+        overrides=overrides,
+        networkConfiguration={
+            "awsvpcConfiguration": {
+                "subnets": subnets,
+                "securityGroups": security_groups,
+                "assignPublicIp": "ENABLED",
+            }
+        },
+        count=1,
+    )
 
     failures = (run_resp or {}).get("failures", [])
     if failures:
-        return False, [f"run_task failure: {failures}"]
+        return None, "", [f"run_task failure: {failures}"]
 
     task_arn = run_resp["tasks"][0]["taskArn"]
+    ecs_task_id = task_arn.rpartition("/")[2]
+    return task_arn, f"{stream_prefix}/builder/{ecs_task_id}", []
 
-    # Wait until STOPPED
-    waiter = ecs.get_waiter("tasks_stopped")
-    try:
-        # Delay: 15s, MaxAttempts: 720 ≈ 3 hours (tune as you like)
-        waiter.wait(
-            cluster=cluster_arn,
-            tasks=[task_arn],
-            WaiterConfig={"Delay": 15, "MaxAttempts": 720},
-        )
-    except WaiterError:
-        # Still proceed to DescribeTasks
-        pass
-
-    # Describe to get exit code
-    desc = ecs.describe_tasks(cluster=cluster_arn, tasks=[task_arn])["tasks"][0]
-    exit_code = None
-    for c in desc.get("containers", []):
-        if c.get("name") == "builder":
-            exit_code = c.get("exitCode")
-            break
-
-    # Fetch CloudWatch Logs tail (best-effort)
-    lines: List[str] = []
-    ecs_task_id = task_arn.split("/")[-1]
-    log_stream_name = f"{stream_prefix}/builder/{ecs_task_id}"
-    try:
-        token = None
-        for _ in range(50):
-            kw = dict(
-                logGroupName=cloudwatch_log_group,
-                logStreamName=log_stream_name,
-                startFromHead=True,
-            )
-            if token:
-                kw["nextToken"] = token
-            resp = logs.get_log_events(**kw)
-            for e in resp.get("events", []):
-                lines.append(e.get("message", ""))
-            nxt = resp.get("nextForwardToken")
-            if nxt == token:
-                break
-            token = nxt
-    except ClientError as e:
-        lines.append(f"[logs] unable to fetch: {e}")
+def _builder_exit_code(desc: dict) -> Optional[int]:
+    return next(
+        (c.get("exitCode") for c in desc.get("containers", ()) if c.get("name") == "builder"), None
+    )
 
+def _builder_result(
+    region: str,
+    desc: dict,
+    log_group: str,
+    log_stream_name: str,
+    log_filter_pattern: Optional[str],
+    materialize: bool,
+) -> Tuple[bool, Iterable[str]]:
+    """(ok, log tail) from the final task description."""
+    exit_code = _builder_exit_code(desc)
+
+    # Bound the filtered scan to the task's own lifetime
+    started = desc.get("startedAt") or desc.get("createdAt")
+    start_ms = int(started.timestamp() * 1000) if started else None
+
+    # CloudWatch Logs tail (best-effort); fetched lazily when first iterated
+    lines: Iterable[str] = _iter_log_tail(
+        _logs(region), log_group, log_stream_name,
+        filter_pattern=log_filter_pattern, start_time_ms=start_ms,
+    )
     if exit_code is None:
-        lines.append("[builder] missing exit code in ECS describe_tasks")
+        lines = chain(lines, ["[builder] missing exit code in ECS describe_tasks"])
 
-    return (exit_code == 0), lines[-400:]
+    return (exit_code == 0), (list(lines) if materialize else lines)
+
+def submit_builder_and_wait(
+    *,
+    region: str,
+    cluster_arn: str,
+    subnets: List[str],
+    security_groups: List[str],
+    cloudwatch_log_group: str,
+    task_family: str,                 # family name OR full task definition ARN
+    task_exec_role_arn: Optional[str] = None,
+    task_role_arn: Optional[str] = None,
+    image: Optional[str] = None,
+    env: Optional[Dict[str, str]] = None,
+    cpu: str = "2048",
+    memory: str = "12288",
+    stream_prefix: str = "builder",
+    log_filter_pattern: Optional[str] = None,
+    timeout_s: int = 3 * 60 * 60,
+    materialize: bool = True,
+) -> Tuple[bool, Iterable[str]]:
+    """
+    Run a one-off builder task and wait for STOPPED. Returns (ok, last_logs_tail).
+    If 'task_family' is a family name, we reuse the latest ACTIVE revision, creating one
+    if the family doesn't exist yet or our own last revision has a different spec
+    (needs 'image'). If 'task_family' is a full ARN, it's used directly.
+    If 'log_filter_pattern' is set, only matching log lines are returned (filtered
+    server-side by CloudWatch). 'timeout_s' bounds the wait for STOPPED.
+    With materialize=False the log tail is returned as a lazy iterator instead of a list.
+    """
+    task_arn, log_stream_name, failure = _start_builder(
+        region=region,
+        cluster_arn=cluster_arn,
+        subnets=subnets,
+        security_groups=security_groups,
+        cloudwatch_log_group=cloudwatch_log_group,
+        task_family=task_family,
+        task_exec_role_arn=task_exec_role_arn,
+        task_role_arn=task_role_arn,
+        image=image,
+        env=env,
+        cpu=cpu,
+        memory=memory,
+        stream_prefix=stream_prefix,
+    )
+    if task_arn is None:
+        return False, failure
+
+    # Wait until STOPPED; the last poll already carries the exit code
+    desc = wait_for_tasks_stopped(
+        region=region, cluster_arn=cluster_arn, task_arns=[task_arn], timeout_s=timeout_s
+    ).get(task_arn, {})
+    return _builder_result(
+        region, desc, cloudwatch_log_group, log_stream_name, log_filter_pattern, materialize
+    )
+
+async def submit_builder_and_wait_async(
+    *,
+    region: str,
+    cluster_arn: str,
+    subnets: List[str],
+    security_groups: List[str],
+    cloudwatch_log_group: str,
+    task_family: str,                 # family name OR full task definition ARN
+    task_exec_role_arn: Optional[str] = None,
+    task_role_arn: Optional[str] = None,
+    image: Optional[str] = None,
+    env: Optional[Dict[str, str]] = None,
+    cpu: str = "2048",
+    memory: str = "12288",
+    stream_prefix: str = "builder",
+    log_filter_pattern: Optional[str] = None,
+    timeout_s: int = 3 * 60 * 60,
+    materialize: bool = True,
+) -> Tuple[bool, Iterable[str]]:
+    """
+    Awaitable submit_builder_and_wait (same arguments). AWS calls run in worker
+    threads, but the wait for STOPPED is an asyncio loop, so no thread is pinned
+    for the build's lifetime and many builders can be awaited with asyncio.gather.
+    """
+    task_arn, log_stream_name, failure = await asyncio.to_thread(
+        _start_builder,
+        region=region,
+        cluster_arn=cluster_arn,
+        subnets=subnets,
+        security_groups=security_groups,
+        cloudwatch_log_group=cloudwatch_log_group,
+        task_family=task_family,
+        task_exec_role_arn=task_exec_role_arn,
+        task_role_arn=task_role_arn,
+        image=image,
+        env=env,
+        cpu=cpu,
+        memory=memory,
+        stream_prefix=stream_prefix,
+    )
+    if task_arn is None:
+        return False, failure
+
+    desc = (await wait_for_tasks_stopped_async(
+        region=region, cluster_arn=cluster_arn, task_arns=[task_arn], timeout_s=timeout_s
+    )).get(task_arn, {})
+    return await asyncio.to_thread(
+        _builder_result,
+        region, desc, cloudwatch_log_group, log_stream_name, log_filter_pattern, materialize,
+    )
+
+def submit_builder(
+    *,
+    region: str,
+    cluster_arn: str,
+    subnets: List[str],
+    security_groups: List[str],
+    cloudwatch_log_group: str,
+    task_family: str,                 # family name OR full task definition ARN
+    task_exec_role_arn: Optional[str] = None,
+    task_role_arn: Optional[str] = None,
+    image: Optional[str] = None,
+    env: Optional[Dict[str, str]] = None,
+    cpu: str = "2048",
+    memory: str = "12288",
+    stream_prefix: str = "builder",
+) -> Tuple[str, str]:
+    """
+    Start a builder task without waiting for it. Returns (task_arn, log_stream_name);
+    poll with get_task_status. Raises RuntimeError if ECS could not place the task.
+    """
+    task_arn, log_stream_name, failure = _start_builder(
+        region=region,
+        cluster_arn=cluster_arn,
+        subnets=subnets,
+        security_groups=security_groups,
+        cloudwatch_log_group=cloudwatch_log_group,
+        task_family=task_family,
+        task_exec_role_arn=task_exec_role_arn,
+        task_role_arn=task_role_arn,
+        image=image,
+        env=env,
+        cpu=cpu,
+        memory=memory,
+        stream_prefix=stream_prefix,
+    )
+    if task_arn is None:
+        raise RuntimeError("; ".join(failure))
+    return task_arn, log_stream_name
+
+def _task_status(task_arn: str, desc: dict) -> Dict[str, Optional[object]]:
+    overrides = desc.get("overrides", {}).get("containerOverrides", ())
+    return {
+        "task_arn": task_arn,
+        "status": desc.get("lastStatus", "MISSING"),
+        "exit_code": _builder_exit_code(desc),
+        "stopped_reason": desc.get("stoppedReason"),
+        "stopped_at": desc.get("stoppedAt"),
+        "env": {e["name"]: e["value"] for c in overrides for e in c.get("environment", ())},
+    }
+
+def get_task_status(*, region: str, cluster_arn: str, task_arn: str) -> Dict[str, Optional[object]]:
+    """
+    Current status of a builder task (one describe_tasks): status, exit_code, stopped_reason,
+    stopped_at and the env it was started with. status is "MISSING" once ECS no longer knows the task.
+    """
+    latest: Dict[str, dict] = {}
+    _poll_tasks(_ecs(region), cluster_arn, [task_arn], latest)
+    return _task_status(task_arn, latest.get(task_arn, {}))
+
+async def get_task_statuses_async(
+    *, region: str, cluster_arn: str, task_arns: List[str]
+) -> List[Dict[str, Optional[object]]]:
+    """
+    get_task_status for many tasks at once, in input order. Each describe_tasks
+    batch of 100 runs in its own worker thread, and the batches run concurrently.
+    """
+    ecs = _ecs(region)
+    arns = list(dict.fromkeys(task_arns))
+    latest: Dict[str, dict] = {}
+    await asyncio.gather(*(
+        asyncio.to_thread(_poll_tasks, ecs, cluster_arn, arns[i:i + 100], latest)
+        for i in range(0, len(arns), 100)
+    ))
+    return [_task_status(a, latest.get(a, {})) for a in task_arns]
 
 # ---------- Router service (ensure/create) ----------
 
+# (namespace_id, service_name) -> Cloud Map service ARN, filled on first resolution
+_registry_arns: Dict[Tuple[str, str], str] = {}
+
+def _ensure_cloudmap_service(region: str, cloudmap_namespace_id: str, service_name: str) -> Optional[str]:
+    """Create the Cloud Map service (idempotent); returns its ARN if known."""
+    key = (cloudmap_namespace_id, service_name)
+    if key in _registry_arns:
+        return _registry_arns[key]
+
+    sd = _sd(region)
+    registry_arn = None
+    try:
+        resp = sd.create_service(
+            Name=service_name,
+            NamespaceId=cloudmap_namespace_id,
+            DnsConfig={"DnsRecords": [{"Type": "A", "TTL": 10}], "RoutingPolicy": "MULTIVALUE"},
+            HealthCheckCustomConfig={"FailureThreshold": 1},
+        )
+        registry_arn = resp["Service"]["Arn"]
+        print(f"[router/ensure] Cloud Map create_service OK arn={registry_arn}")
+    except ClientError as e:
+        code = e.response.get("Error", {}).get("Code")
+        if code in ("ServiceAlreadyExists", "DuplicateRequest", "ResourceAlreadyExistsException"):
+            # ServiceAlreadyExists carries the existing service's ID: one get_service call
+            service_id = e.response.get("ServiceId")
+            if service_id:
+                registry_arn = sd.get_service(Id=service_id)["Service"]["Arn"]
+                print(f"[router/ensure] found existing Cloud Map service arn={registry_arn}")
+                _registry_arns[key] = registry_arn
+                return registry_arn
+            # ListServices can't filter by name, so walk the namespace
+            paginator = sd.get_paginator("list_services")
+            pages = paginator.paginate(
+                Filters=[{"Name": "NAMESPACE_ID", "Values": [cloudmap_namespace_id]}]
+            )
+            for page in pages:
+                # remember every service we walk past so other scenarios hit the cache
+                for x in page.get("Services", []):
+                    if x.get("Name") and x.get("Arn"):
+                        _registry_arns[(cloudmap_namespace_id, x["Name"])] = x["Arn"]
+                registry_arn = _registry_arns.get(key)
+                if registry_arn:
+                    print(f"[router/ensure] found existing Cloud Map service arn={registry_arn}")
+                    break
+        else:
+            print("[router/ensure] create_service ClientError:", e.response)
+            raise
+
+    if registry_arn:
+        _registry_arns[key] = registry_arn
+    return registry_arn
+
 def ensure_router_service(
     *,
     region: str,
@@ -298,7 +740,7 @@ def ensure_router_service(
     # --- failure-loop guard controls (new) ---
     auto_stop_on_fail: bool = True,
     fail_window_seconds: int = 300,   # watch window (seconds)
-    fail_threshold: int = 3           # stop after N failures within window
+    fail_threshold: int = 3,          # stop after N failures within window
 ) -> str:
     """
     Register a per-scenario TD revision (injects GRAPH_SCENARIO_ID; optionally overrides
@@ -311,78 +753,62 @@ def ensure_router_service(
     if not image:
         raise ValueError("ensure_router_service: image is required")
 
-    ecs = _ecs(region)
-    sd  = _sd(region)
     service_name = f"{service_prefix}-{scenario_id}"
+    ecs = _ecs(region)
     print(f"[router/ensure] >>> start service_name={service_name}")
 
-    # --- Cloud Map ensure (idempotent) ---
-    registry_arn = None
-    try:
-        resp = sd.create_service(
-            Name=service_name,
-            NamespaceId=cloudmap_namespace_id,
-            DnsConfig={"DnsRecords": [{"Type": "A", "TTL": 10}], "RoutingPolicy": "MULTIVALUE"},
-            HealthCheckCustomConfig={"FailureThreshold": 1},
-        )
-        registry_arn = resp["Service"]["Arn"]
-        print(f"[router/ensure] Cloud Map create_service OK arn={registry_arn}")
-    except ClientError as e:
-        code = e.response.get("Error", {}).get("Code")
-        if code in ("ServiceAlreadyExists", "DuplicateRequest", "ResourceAlreadyExistsException"):
-            svc_list = sd.list_services(
-                Filters=[{"Name": "NAMESPACE_ID", "Values": [cloudmap_namespace_id]}]
-            ).get("Services", [])
-            for svc in svc_list:
-                if svc.get("Name") == service_name:
-                    registry_arn = svc.get("Arn")
-                    print(f"[router/ensure] found existing Cloud Map service arn={registry_arn}")
-                    break
-        else:
-            print("[router/ensure] create_service ClientError:", e.response)
-            raise
+    # Independent calls run in the background while the task definition is prepared
+    fut_sd = _POOL.submit(_ensure_cloudmap_service, region, cloudmap_namespace_id, service_name)
+    fut_svc = _POOL.submit(ecs.describe_services, cluster=cluster_arn, services=[service_name])
+    # describing by family name resolves the latest ACTIVE revision in a single call
+    fut_td = _POOL.submit(ecs.describe_task_definition, taskDefinition=task_family, include=["TAGS"])
 
     # --- Get latest ACTIVE base TD ---
-    resp = ecs.list_task_definitions(familyPrefix=task_family, status="ACTIVE", sort="DESC", maxResults=1)
-    arns = resp.get("taskDefinitionArns", [])
-    if not arns:
-        raise RuntimeError(f"No ACTIVE task definition found for family '{task_family}'.")
-    base_td = ecs.describe_task_definition(taskDefinition=arns[0])["taskDefinition"]
+    try:
+        base_resp = fut_td.result()
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") == "ClientException":
+            raise RuntimeError(f"No ACTIVE task definition found for family '{task_family}'.") from e
+        raise
+    base_td = base_resp["taskDefinition"]
+    base_tags = {t["key"]: t["value"] for t in base_resp.get("tags", [])}
 
     # --- Clone and inject env ---
-    cds = copy.deepcopy(base_td["containerDefinitions"])
+    # only the router container (and the parts of it we change) is copied; the rest is shared
+    cds = list(base_td["containerDefinitions"])
     if not cds:
         raise RuntimeError("Base task definition has no containerDefinitions")
     idx = next((i for i, c in enumerate(cds) if c.get("name") == "router"), 0)
-    c0 = cds[idx]
+    c0 = cds[idx] = dict(cds[idx])
 
     # merge env from base + caller
-    base_env = {e["name"]: e["value"] for e in c0.get("environment", [])}
-    add_env  = dict(env or {})
-    add_env["GRAPH_SCENARIO_ID"] = scenario_id
+    merged = {e["name"]: e["value"] for e in c0.get("environment", ())}
+    merged["AWS_REGION"] = region  # caller's env may still override it
+    merged.update(env or {})
+    merged["GRAPH_SCENARIO_ID"] = scenario_id
     if graphs_bucket:
-        add_env["GRAPHS_BUCKET"] = graphs_bucket
+        merged["GRAPHS_BUCKET"] = graphs_bucket
     if graph_prefix:
-        add_env["GRAPH_PREFIX"] = graph_prefix
-    add_env.setdefault("AWS_REGION", region)
-    merged = {**base_env, **add_env}
-    c0["environment"] = [{"name": k, "value": v} for k, v in sorted(merged.items())]
+        merged["GRAPH_PREFIX"] = graph_prefix
+    c0["environment"] = _env_pairs(merged)
 
     # image / logs / port
     if image:
         c0["image"] = image
     if c0.get("logConfiguration", {}).get("logDriver") == "awslogs":
-        opts = c0["logConfiguration"].setdefault("options", {})
+        log_cfg = c0["logConfiguration"] = dict(c0["logConfiguration"])
+        opts = log_cfg["options"] = dict(log_cfg.get("options") or {})
         if cw_log_group:
             opts["awslogs-group"] = cw_log_group
         opts.setdefault("awslogs-region", region)
         opts.setdefault("awslogs-create-group", "true")
     if "portMappings" in c0 and c0["portMappings"]:
-        c0["portMappings"][0]["containerPort"] = container_port
+        ports = c0["portMappings"] = list(c0["portMappings"])
+        ports[0] = {**ports[0], "containerPort": container_port}
     else:
         c0["portMappings"] = [{"containerPort": container_port, "protocol": "tcp"}]
 
-    # --- Register new TD revision ---
+    # --- Register new TD revision (unless the latest one already has this exact spec) ---
     reg_kwargs = {
         "family": base_td["family"],
         "taskRoleArn": task_role_arn or base_td.get("taskRoleArn"),
@@ -395,19 +821,28 @@ def ensure_router_service(
         "runtimePlatform": base_td.get("runtimePlatform"),
         "ephemeralStorage": base_td.get("ephemeralStorage"),
         "volumes": base_td.get("volumes") or [],
-        "tags": [{"key": "scenario_id", "value": scenario_id}],
     }
     reg_kwargs = {k: v for k, v in reg_kwargs.items() if v not in (None, [], {})}
-    new_td_arn = ecs.register_task_definition(**reg_kwargs)["taskDefinition"]["taskDefinitionArn"]
-    desc = ecs.describe_task_definition(taskDefinition=new_td_arn)["taskDefinition"]
-    print("[router/ensure] new TD env:", [
-        {"name": e["name"], "value": e["value"]}
-        for e in desc["containerDefinitions"][idx].get("environment", [])
-    ])
+    spec_hash = _spec_hash(reg_kwargs)
+    if base_tags.get("specHash") == spec_hash and base_td.get("status") == "ACTIVE":
+        new_td_arn = base_td["taskDefinitionArn"]
+        print(f"[router/ensure] reusing identical TD {new_td_arn}")
+    else:
+        reg_kwargs["tags"] = [
+            {"key": "scenario_id", "value": scenario_id},
+            {"key": "specHash", "value": spec_hash},
+        ]
+        # the register response already carries the full task definition
+        new_td = ecs.register_task_definition(**reg_kwargs)["taskDefinition"]
+        new_td_arn = new_td["taskDefinitionArn"]
+        print("[router/ensure] new TD env:", [
+            {"name": e["name"], "value": e["value"]}
+            for e in new_td["containerDefinitions"][idx].get("environment", [])
+        ])
 
     # --- Create/Update Service (idempotent + fallback) ---
-    svc_resp = ecs.describe_services(cluster=cluster_arn, services=[service_name])
-    svcs = svc_resp.get("services", [])
+    registry_arn = fut_sd.result()
+    svcs = fut_svc.result().get("services", [])
     exists = svcs and svcs[0].get("status") != "INACTIVE"
 
     deploy_cfg = {
@@ -417,82 +852,54 @@ def ensure_router_service(
     }
 
     if exists:
-        # UPDATE path (retry only for transient/server-side errors)
-        for attempt in range(6):
-            try:
-                resp = ecs.update_service(
-                    cluster=cluster_arn,
-                    service=service_name,
-                    taskDefinition=new_td_arn,
-                    desiredCount=desired_count,
-                    forceNewDeployment=True,
-                    deploymentConfiguration=deploy_cfg,  # NEW
-                )
-                print(f"[router/ensure] update_service OK arn={resp['service']['serviceArn']}")
-                break
-            except Exception as e:
-                if _is_transient(e) and attempt < 5:
-                    print(f"[router/ensure] update_service transient err; attempt={attempt}; err={repr(e)}")
-                    _sleep_backoff(attempt)
-                    continue
-                raise
+        # UPDATE path (transient errors are retried by botocore, see _BOTO_CFG)
+        resp = ecs.update_service(
+            cluster=cluster_arn,
+            service=service_name,
+            taskDefinition=new_td_arn,
+            desiredCount=desired_count,
+            forceNewDeployment=True,
+            deploymentConfiguration=deploy_cfg,  # NEW
+        )
+        print(f"[router/ensure] update_service OK arn={resp['service']['serviceArn']}")
     else:
-        # CREATE path with backoff; fall back to no-SD then attach SD
+        # CREATE path; on a server-side failure with SD, create without SD then attach SD
+        create_kwargs = dict(
+            cluster=cluster_arn,
+            serviceName=service_name,
+            taskDefinition=new_td_arn,
+            desiredCount=desired_count,
+            launchType="FARGATE",
+            deploymentConfiguration=deploy_cfg,  # NEW
+            networkConfiguration={
+                "awsvpcConfiguration": {
+                    "subnets": subnets,
+                    "securityGroups": security_groups,
+                    "assignPublicIp": "ENABLED",
+                }
+            },
+            enableExecuteCommand=True,
+            propagateTags="SERVICE",
+            tags=[{"key": "scenario_id", "value": scenario_id}],
+        )
         created = False
-        for attempt in range(6):
-            try:
-                print(f"[router/ensure] create_service with SD attempt={attempt}")
-                ecs.create_service(
-                    cluster=cluster_arn,
-                    serviceName=service_name,
-                    taskDefinition=new_td_arn,
-                    desiredCount=desired_count,
-                    launchType="FARGATE",
-                    deploymentConfiguration=deploy_cfg,  # NEW
-                    networkConfiguration={
-                        "awsvpcConfiguration": {
-                            "subnets": subnets,
-                            "securityGroups": security_groups,
-                            "assignPublicIp": "ENABLED",
-                        }
-                    },
-                    serviceRegistries=[{"registryArn": registry_arn}] if registry_arn else [],
-                    enableExecuteCommand=True,
-                    propagateTags="SERVICE",
-                    tags=[{"key": "scenario_id", "value": scenario_id}],
-                )
-                created = True
-                print("[router/ensure] create_service OK (with SD)")
-                break
-            except ClientError as e:
-                code = e.response.get("Error", {}).get("Code")
-                msg  = e.response.get("Error", {}).get("Message", "")
-                if code in {"ServerException", "ServiceUnavailableException"}:
-                    print(f"[router/ensure] create_service server-side err; attempt={attempt}; msg={msg}")
-                    _sleep_backoff(attempt)
-                    continue
+        try:
+            ecs.create_service(
+                **create_kwargs,
+                serviceRegistries=[{"registryArn": registry_arn}] if registry_arn else [],
+            )
+            created = True
+            print("[router/ensure] create_service OK (with SD)")
+        except ClientError as e:
+            code = e.response.get("Error", {}).get("Code")
+            msg  = e.response.get("Error", {}).get("Message", "")
+            if code not in {"ServerException", "ServiceUnavailableException"}:
                 raise
+            print(f"[router/ensure] create_service with SD failed server-side after botocore retries; msg={msg}")
 
         if not created:
             print("[router/ensure] fallback: create without SD, then attach SD")
-            ecs.create_service(
-                cluster=cluster_arn,
-                serviceName=service_name,
-                taskDefinition=new_td_arn,
-                desiredCount=desired_count,
-                launchType="FARGATE",
-                deploymentConfiguration=deploy_cfg,  # NEW
-                networkConfiguration={
-                    "awsvpcConfiguration": {
-                        "subnets": subnets,
-                        "securityGroups": security_groups,
-                        "assignPublicIp": "ENABLED",
-                    }
-                },
-                enableExecuteCommand=True,
-                propagateTags="SERVICE",
-                tags=[{"key": "scenario_id", "value": scenario_id}],
-            )
+            ecs.create_service(**create_kwargs)
             time.sleep(3)
             ecs.update_service(
                 cluster=cluster_arn,
@@ -502,38 +909,36 @@ def ensure_router_service(
             )
             print("[router/ensure] attached SD via update_service")
 
-        # cosmetic wait until service reflects new TD
-        for _ in range(6):
+        # cosmetic wait until service reflects new TD (usually immediate, so poll densely first)
+        backoff = _DecorrelatedBackoff(base=0.25, cap=4.0)
+        deadline = time.time() + 6.0
+        while True:
             s = ecs.describe_services(cluster=cluster_arn, services=[service_name])["services"][0]
-            if s.get("taskDefinition") == new_td_arn:
+            if s.get("taskDefinition") == new_td_arn or time.time() >= deadline:
                 break
-            time.sleep(1.0)
+            backoff.sleep(deadline - time.time())
 
     # --- Fail-loop guard: stop if tasks keep failing quickly ---
     if auto_stop_on_fail and desired_count > 0:
         start = time.time()
-        failures = 0
         td_target = new_td_arn
         while time.time() - start < fail_window_seconds:
             svc = ecs.describe_services(cluster=cluster_arn, services=[service_name])["services"][0]
             if svc.get("runningCount", 0) >= desired_count:
                 break  # reached healthy state
 
-            task_arns = ecs.list_tasks(
-                cluster=cluster_arn,
-                serviceName=service_name,
-                desiredStatus="STOPPED",
-                maxResults=10,
-            ).get("taskArns", [])
-
-            if task_arns:
-                tasks = ecs.describe_tasks(cluster=cluster_arn, tasks=task_arns)["tasks"]
-                for t in tasks:
-                    if t.get("taskDefinitionArn") == td_target and t.get("lastStatus") == "STOPPED":
-                        failures += 1
-
-            if failures >= fail_threshold:
-                print(f"[router/ensure] auto-stop: {failures} failures within {fail_window_seconds}s; scaling to 0")
+            # the deployment for our TD already counts its failed tasks (and the circuit breaker's verdict)
+            dep = next(
+                (d for d in svc.get("deployments", ()) if d.get("taskDefinition") == td_target), {}
+            )
+            failures = dep.get("failedTasks", 0)
+            rollout_failed = dep.get("rolloutState") == "FAILED"
+
+            if rollout_failed or failures >= fail_threshold:
+                print(
+                    f"[router/ensure] auto-stop: {failures} failures within {fail_window_seconds}s"
+                    f"{' (rollout FAILED)' if rollout_failed else ''}; scaling to 0"
+                )
                 try:
                     ecs.update_service(cluster=cluster_arn, service=service_name, desiredCount=0)
                 except Exception as e:
@@ -554,29 +959,39 @@ def delete_router_service(
     region: str,
     cluster_arn: str,
     service_name: str,
+    wait: bool = False,
+    wait_timeout_s: int = 120,
 ) -> None:
-    """Scale service to 0 then delete (best-effort)."""
+    """
+    Scale service to 0 then delete (best-effort). delete_service(force=True) stops
+    any running tasks itself, so there is no drain wait; pass wait=True to block
+    until ECS reports the service INACTIVE (at most 'wait_timeout_s').
+    """
+    for key in [k for k in list(_registry_arns) if k[1] == service_name]:
+        _registry_arns.pop(key, None)
     ecs = _ecs(region)
     try:
         ecs.update_service(cluster=cluster_arn, service=service_name, desiredCount=0)
-    except ClientError as e:
-        code = e.response.get("Error", {}).get("Code")
-        if code in ("ClusterNotFoundException", "ServiceNotFoundException"):
-            return
-        raise
-
-    # Wait briefly for tasks to drain
-    for _ in range(30):
-        d = ecs.describe_services(cluster=cluster_arn, services=[service_name])
-        s = d.get("services", [{}])[0]
-        if s.get("runningCount", 0) == 0:
-            break
-        time.sleep(2)
-
-    try:
         ecs.delete_service(cluster=cluster_arn, service=service_name, force=True)
     except ClientError as e:
         code = e.response.get("Error", {}).get("Code")
         if code in ("ClusterNotFoundException", "ServiceNotFoundException"):
             return
         raise  # Re-raise the original exception
+
+    if wait:
+        # most services go INACTIVE within seconds: poll densely first, then back off
+        deadline = time.time() + wait_timeout_s
+        backoff = _DecorrelatedBackoff(base=1.0, cap=16.0)
+        while True:
+            svcs = ecs.describe_services(cluster=cluster_arn, services=[service_name])["services"]
+            if not svcs or svcs[0].get("status") == "INACTIVE":
+                return
+            if time.time() >= deadline:
+                s = svcs[0]
+                print(
+                    f"[router/delete] {service_name} not INACTIVE yet: status={s.get('status')} "
+                    f"running={s.get('runningCount', 0)} pending={s.get('pendingCount', 0)}"
+                )
+                return
+            backoff.sleep(deadline - time.time())
@@ -1,19 +1,28 @@
 # app/main.py
 import os
-import boto3
-from fastapi import FastAPI, UploadFile, Form, File, HTTPException, Query
+import re
+import tempfile
+from fastapi import FastAPI, UploadFile, Form, File, HTTPException, Query, Header
 
 from app.ecs_control import (
-    submit_builder_and_wait,
+    client,
+    submit_builder,
+    get_task_status,
     ensure_router_service,
     delete_router_service,
+    router_dns_name,
+    warm_clients,
 )
+from boto3.s3.transfer import TransferConfig
 from botocore.exceptions import ClientError
 from typing import Literal, Optional
 import time
 import asyncio
-import socket
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from fastapi import Response
+from fastapi.responses import JSONResponse
 
 app = FastAPI()
 
@@ -39,23 +48,155 @@ SNIPPETS_DIR = os.getenv("NGINX_SNIPPETS_DIR", "/shared/nginx/routers").rstrip("
 LOG_GROUP_BUILDER = os.getenv("LOG_GROUP_BUILDER", "/mobilys-otp/builder")
 LOG_GROUP_ROUTER  = os.getenv("LOG_GROUP_ROUTER", "/mobilys-otp/router")
 
-s3  = boto3.client("s3",  region_name=AWS_REGION)
-ecs = boto3.client("ecs", region_name=AWS_REGION)
+# Created on first use (not at import) from app.ecs_control's cached, fork-aware clients,
+# so both modules reuse one connection pool per service.
+def _s3():
+    return client("s3", AWS_REGION)
+
+def _ecs():
+    return client("ecs", AWS_REGION)
+
+# Warmup: how /api/router_warmup polls for the service to become stable
+WARMUP_POLL_INITIAL = float(os.getenv("WARMUP_POLL_INITIAL", "2"))
+WARMUP_POLL_MAX = float(os.getenv("WARMUP_POLL_MAX", "15"))
+WARMUP_BACKOFF = float(os.getenv("WARMUP_BACKOFF", "1.5"))
+WARMUP_STABLE_TIMEOUT = float(os.getenv("WARMUP_STABLE_TIMEOUT", "300"))
 
 # Idle after which we scale to 0 (seconds). Override with env ROUTER_IDLE_SECONDS if you want.
 IDLE_SECS = int(os.getenv("ROUTER_IDLE_SECONDS", "1800"))  # 15 minutes
-_last_hit = {}  # scenario_id -> last epoch seconds
-
-def _tcp_check(host: str, port: int, timeout: float = 1.5) -> bool:
+# scenario_id -> last epoch seconds, least recently hit first; capped so bogus rids can't grow it forever
+_last_hit = OrderedDict()
+LAST_HIT_MAX = int(os.getenv("ROUTER_LAST_HIT_MAX", "10000"))
+
+# Optional DynamoDB table (partition key "rid", type S) sharing last hits across uvicorn workers
+# and restarts; without it each process only knows its own hits.
+LAST_HIT_TABLE = os.getenv("LAST_HIT_TABLE") or None
+LAST_HIT_WRITE_EVERY = 60  # seconds between table writes per rid
+_last_persisted = {}  # rid -> ts last written to LAST_HIT_TABLE
+
+# job_id -> in-flight router bring-up after a build; concurrent /build_status polls share one
+_finish_inflight = {}
+
+def _scale_down(rid: str) -> None:
+    svc = _service_name(rid)
+    print(f"[idle-reaper] scaling down {svc}")
+    try:
+        _ecs().update_service(
+            cluster=ECS_CLUSTER_ARN,
+            service=svc,
+            desiredCount=0,
+        )
+    except Exception as e:
+        print(f"[idle-reaper] update_service({svc}) failed: {e}")
+        return
+    if LAST_HIT_TABLE:
+        # scaled down: its row would only make every worker reap it again after a restart
+        _forget_hit(rid, before=time.time() - IDLE_SECS)
+
+# rid -> in-flight scale-down; a warmup for the same rid waits for it before scaling up
+_scaledown_inflight = {}
+
+def _begin_scale_down(rid: str):
+    """Run _scale_down(rid) in the executor, tracked so a warmup can't be overtaken by it."""
+    fut = asyncio.get_running_loop().run_in_executor(None, _scale_down, rid)
+    _scaledown_inflight[rid] = fut
+    fut.add_done_callback(lambda _f: _scaledown_done(rid, _f))
+    return fut
+
+def _scaledown_done(rid: str, fut) -> None:
+    # a newer scale-down may have replaced ours; warmups must keep waiting on that one
+    if _scaledown_inflight.get(rid) is fut:
+        del _scaledown_inflight[rid]
+
+def _persist_hit(rid: str, ts: float) -> None:
     try:
-        with socket.create_connection((host, port), timeout=timeout):
-            return True
+        client("dynamodb", AWS_REGION).put_item(
+            TableName=LAST_HIT_TABLE,
+            Item={
+                "rid": {"S": rid},
+                "ts": {"N": repr(ts)},
+                "expires_at": {"N": str(int(ts + 3 * IDLE_SECS))},  # for a table TTL, if enabled
+            },
+        )
+    except Exception as e:
+        print(f"[last-hit] put_item({rid}) failed: {e}")
+
+def _shared_last_hit(rid: str) -> Optional[float]:
+    item = client("dynamodb", AWS_REGION).get_item(
+        TableName=LAST_HIT_TABLE, Key={"rid": {"S": rid}}, ConsistentRead=True
+    ).get("Item")
+    return float(item["ts"]["N"]) if item else None
+
+def _forget_hit(rid: str, before: Optional[float] = None) -> None:
+    """Delete rid's row; with 'before', only if no worker has recorded a hit since then."""
+    cond = (
+        {"ConditionExpression": "ts <= :before", "ExpressionAttributeValues": {":before": {"N": repr(before)}}}
+        if before is not None else {}
+    )
+    try:
+        client("dynamodb", AWS_REGION).delete_item(
+            TableName=LAST_HIT_TABLE, Key={"rid": {"S": rid}}, **cond
+        )
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") != "ConditionalCheckFailedException":
+            print(f"[last-hit] delete_item({rid}) failed: {e}")
+    except Exception as e:
+        print(f"[last-hit] delete_item({rid}) failed: {e}")
+
+def _load_last_hits() -> dict:
+    """Rows hit within IDLE_SECS (older ones are already idle or gone), at most LAST_HIT_MAX newest."""
+    hits = {}
+    paginator = client("dynamodb", AWS_REGION).get_paginator("scan")
+    for page in paginator.paginate(
+        TableName=LAST_HIT_TABLE,
+        ProjectionExpression="rid, ts",
+        FilterExpression="ts > :cutoff",
+        ExpressionAttributeValues={":cutoff": {"N": repr(time.time() - IDLE_SECS)}},
+    ):
+        for item in page.get("Items", []):
+            hits[item["rid"]["S"]] = float(item["ts"]["N"])
+    return dict(sorted(hits.items(), key=lambda kv: kv[1])[-LAST_HIT_MAX:])
+
+def _touch(rid: str) -> None:
+    """Record a hit for rid; past LAST_HIT_MAX the longest-idle router is scaled down and forgotten."""
+    now = time.time()
+    _last_hit[rid] = now
+    _last_hit.move_to_end(rid)
+    loop = asyncio.get_running_loop()
+    if LAST_HIT_TABLE and now - _last_persisted.get(rid, 0.0) >= LAST_HIT_WRITE_EVERY:
+        _last_persisted[rid] = now
+        loop.run_in_executor(None, _persist_hit, rid, now)
+    while len(_last_hit) > LAST_HIT_MAX:
+        old_rid, _ = _last_hit.popitem(last=False)
+        _last_persisted.pop(old_rid, None)
+        _begin_scale_down(old_rid)
+
+async def _tcp_check(host: str, port: int, timeout: float = 1.5) -> bool:
+    try:
+        _, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
     except Exception:
         return False
+    writer.close()
+    return True
 
+# warmup runs per nginx auth_request: keep the per-rid strings cached
+@lru_cache(maxsize=1024)
 def _router_host(sid: str) -> str:
     # must match the host used in site.conf
-    return f"router-{sid}.mobilys-staging.mobilys-otp.local"
+    return f"{_service_name(sid)}.mobilys-staging.mobilys-otp.local"
+
+@lru_cache(maxsize=1024)
+def _service_name(sid: str) -> str:
+    return f"router-{sid}"
+
+
+def _router_env(sid: str) -> dict:
+    # container env shared by every router service (ensure_router_service adds the rest)
+    return {
+        "AWS_REGION": AWS_REGION,
+        "GRAPHS_BUCKET": GRAPHS_BUCKET,
+        "GRAPH_SCENARIO_ID": sid,
+    }
 
 
 def _require(cond, msg):
@@ -63,10 +204,7 @@ def _require(cond, msg):
         raise HTTPException(status_code=500, detail=msg)
 
 
-def _write_nginx_snippet(scenario_id: str, host: str, port: int = 8081):
-    os.makedirs(SNIPPETS_DIR, exist_ok=True)
-    path = f"{SNIPPETS_DIR}/{scenario_id}.conf"
-    conf = f"""
+_SNIPPET_TEMPLATE = """\
 # generated for {scenario_id}
 location /router/{scenario_id}/ {{
   proxy_set_header Host $host;
@@ -74,9 +212,25 @@ location /router/{scenario_id}/ {{
   proxy_http_version 1.1;
   proxy_pass http://{host}:{port}/;
 }}
-""".lstrip()
-    with open(path, "w") as f:
-        f.write(conf)
+"""
+
+
+def _write_nginx_snippet(scenario_id: str, host: str, port: int = 8081):
+    # SNIPPETS_DIR is created at startup; write-then-rename so the reloader never sees a partial file
+    # unique temp name: two workers may finish the same graph at once
+    path = f"{SNIPPETS_DIR}/{scenario_id}.conf"
+    fd, tmp = tempfile.mkstemp(dir=SNIPPETS_DIR, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(_SNIPPET_TEMPLATE.format(scenario_id=scenario_id, host=host, port=port))
+        os.chmod(tmp, 0o644)  # mkstemp creates 0600; nginx must be able to read it
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except FileNotFoundError:
+            pass
+        raise
     return path
 
 def _graph_id(sid: str, gtype: str) -> str:
@@ -88,25 +242,57 @@ def _remove_nginx_snippet(scenario_id: str):
     except FileNotFoundError:
         pass
 
+@lru_cache(maxsize=32)
+def _versioning_status(bucket: str, _hour: int) -> Optional[str]:
+    # '_hour' rolls the cache key hourly; failed lookups raise and are not cached
+    return _s3().get_bucket_versioning(Bucket=bucket).get("Status")
+
+
 def _bucket_is_versioned(bucket: str) -> bool:
     try:
-        v = s3.get_bucket_versioning(Bucket=bucket)
-        return v.get("Status") in ("Enabled", "Suspended")
+        return _versioning_status(bucket, int(time.time() // 3600)) in ("Enabled", "Suspended")
     except Exception:
         return False
 
 
+# GTFS uploads: 8 MB parts, sent in parallel once the file exceeds one part
+_UPLOAD_CFG = TransferConfig(
+    multipart_threshold=8 * 1024 * 1024,
+    multipart_chunksize=8 * 1024 * 1024,
+    max_concurrency=16,
+    use_threads=True,
+)
+
+# delete_objects batches (1000 keys each) are sent concurrently; the s3 client is thread-safe
+_S3_DELETE_POOL = ThreadPoolExecutor(max_workers=16, thread_name_prefix="s3-delete")
+
+
+_S3_DELETE_INFLIGHT = 32  # batches queued ahead of the listing; bounds memory on huge prefixes
+
+
+def _delete_batch(pending: deque, bucket: str, objs: list) -> None:
+    # listing keeps running while batches delete; past the window, wait for the oldest batch
+    if len(pending) >= _S3_DELETE_INFLIGHT:
+        pending.popleft().result()
+    pending.append(_S3_DELETE_POOL.submit(
+        _s3().delete_objects, Bucket=bucket, Delete={"Objects": objs, "Quiet": True}
+    ))
+
+
 def _delete_prefix_unversioned(bucket: str, prefix: str) -> dict:
     deleted = 0
-    paginator = s3.get_paginator("list_objects_v2")
+    pending = deque()
+    paginator = _s3().get_paginator("list_objects_v2")
     for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
         objs = [{"Key": o["Key"]} for o in page.get("Contents", [])]
         if objs:
-            s3.delete_objects(Bucket=bucket, Delete={"Objects": objs, "Quiet": True})
+            _delete_batch(pending, bucket, objs)
             deleted += len(objs)
+    for f in pending:
+        f.result()  # surface the first failed batch
     # remove the “folder” marker if it exists
     try:
-        s3.delete_object(Bucket=bucket, Key=prefix)
+        _s3().delete_object(Bucket=bucket, Key=prefix)
     except Exception:
         pass
     return {"objects": deleted}
@@ -115,7 +301,8 @@ def _delete_prefix_unversioned(bucket: str, prefix: str) -> dict:
 def _delete_prefix_versioned(bucket: str, prefix: str) -> dict:
     versions = 0
     markers = 0
-    paginator = s3.get_paginator("list_object_versions")
+    pending = deque()
+    paginator = _s3().get_paginator("list_object_versions")
     for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
         batch = []
         for v in page.get("Versions", []):
@@ -125,9 +312,11 @@ def _delete_prefix_versioned(bucket: str, prefix: str) -> dict:
             batch.append({"Key": m["Key"], "VersionId": m["VersionId"]})
         markers += len(page.get("DeleteMarkers", []))
         for i in range(0, len(batch), 1000):
-            s3.delete_objects(Bucket=bucket, Delete={"Objects": batch[i:i+1000], "Quiet": True})
+            _delete_batch(pending, bucket, batch[i:i+1000])
+    for f in pending:
+        f.result()  # surface the first failed batch
     try:
-        s3.delete_object(Bucket=bucket, Key=prefix)
+        _s3().delete_object(Bucket=bucket, Key=prefix)
     except Exception:
         pass
     return {"versions": versions, "delete_markers": markers}
@@ -140,35 +329,70 @@ def _delete_prefix(bucket: str, prefix: str) -> dict:
         else _delete_prefix_unversioned(bucket, prefix)
     )
 
-@app.get("/api/router_warmup")
-def router_warmup(rid: str, resp: Response):
+def _service_is_stable(svc: dict) -> bool:
+    # same condition as boto's services_stable waiter: one deployment, fully running
+    return (
+        len(svc.get("deployments", [])) == 1
+        and svc.get("runningCount", 0) == svc.get("desiredCount", 0)
+    )
+
+
+async def _scale_up_and_wait(service_name: str) -> None:
     """
-    - Record 'last used' for rid
-    - Ensure ECS service router-<rid> is running (desiredCount=1) or create it
-    - Wait until TCP :8081 on router host is reachable
-    - Return 204 (no body) so Nginx auth_request can proceed
+    Make sure router service 'service_name' runs one task and is stable. A service that is
+    already up costs a single describe_services; update_service is only sent when it is
+    scaled to zero (or missing/inactive, where it raises for the caller to handle).
     """
-    now = time.time()
-    _last_hit[rid] = now
+    # poll densely at first, then back off (WARMUP_POLL_* env)
+    deadline = time.time() + WARMUP_STABLE_TIMEOUT
+    delay = WARMUP_POLL_INITIAL
+    scaled = False
+    while True:
+        svcs = (await asyncio.to_thread(
+            _ecs().describe_services, cluster=ECS_CLUSTER_ARN, services=[service_name]
+        ))["services"]
+        svc = svcs[0] if svcs else {}
+        if not scaled and (svc.get("status") != "ACTIVE" or svc.get("desiredCount", 0) < 1):
+            await asyncio.to_thread(
+                _ecs().update_service,
+                cluster=ECS_CLUSTER_ARN,
+                service=service_name,
+                desiredCount=1,
+            )
+            scaled = True
+            continue
+        if svc.get("status") != "ACTIVE":
+            raise RuntimeError(f"{service_name} is missing or inactive")
+        if _service_is_stable(svc):
+            return
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            raise TimeoutError(f"{service_name} not stable after {WARMUP_STABLE_TIMEOUT}s")
+        await asyncio.sleep(min(delay, remaining))
+        delay = min(delay * WARMUP_BACKOFF, WARMUP_POLL_MAX)
+
+
+# rid -> in-flight warmup; concurrent warmups for the same router share one
+_warmup_inflight = {}
+
 
-    service_name = f"router-{rid}"
+async def _do_warmup(rid: str):
+    """Scale up (or create) router-<rid> and wait for :8081. Returns (status_code, body)."""
+    service_name = _service_name(rid)
 
+    pending = _scaledown_inflight.get(rid)
+    if pending is not None:
+        # a scale-down sent just before this hit must land first, or it would undo our scale-up
+        await asyncio.shield(pending)
+
+    # botocore is blocking: run AWS calls off the event loop
     try:
         # Try to scale an existing service up
-        ecs.update_service(
-            cluster=ECS_CLUSTER_ARN,
-            service=service_name,
-            desiredCount=1,
-        )
-        waiter = ecs.get_waiter("services_stable")
-        waiter.wait(
-            cluster=ECS_CLUSTER_ARN,
-            services=[service_name],
-            WaiterConfig={"Delay": 5, "MaxAttempts": 60},
-        )
-    except ecs.exceptions.ServiceNotFoundException:
+        await _scale_up_and_wait(service_name)
+    except _ecs().exceptions.ServiceNotFoundException:
         # Create on demand
-        ensure_router_service(
+        await asyncio.to_thread(
+            ensure_router_service,
             region=AWS_REGION,
             cluster_arn=ECS_CLUSTER_ARN,
             subnets=ECS_SUBNETS,
@@ -180,31 +404,54 @@ def router_warmup(rid: str, resp: Response):
             task_exec_role_arn=TASK_EXEC_ROLE_ARN,
             task_role_arn=TASK_ROLE_ARN,
             image=ROUTER_IMAGE,
-            env={
-                "AWS_REGION": AWS_REGION,
-                "GRAPHS_BUCKET": GRAPHS_BUCKET,
-                "GRAPH_SCENARIO_ID": rid,
-            },
+            env=_router_env(rid),
             desired_count=1,
             container_port=8081,
             cw_log_group=LOG_GROUP_ROUTER,
         )
     except Exception as e:
         print("[warmup] update/create failed:", repr(e))
-        resp.status_code = 503
-        return {"error": "router_warmup_failed", "detail": str(e)}
+        return 503, {"error": "router_warmup_failed", "detail": str(e)}
 
-    # DNS may need a moment; wait for socket to open
+    # DNS may need a moment; wait for socket to open (probe often at first, then back off)
     host = _router_host(rid)
     start = time.time()
+    delay = 0.5
     while time.time() - start < 300:
-        if _tcp_check(host, 8081):
-            resp.status_code = 204  # required by auth_request
-            return
-        time.sleep(2.0)
+        if await _tcp_check(host, 8081):
+            return 204, None  # 204 required by auth_request
+        await asyncio.sleep(delay)
+        delay = min(delay * 1.5, 8.0)
+
+    return 504, {"error": "router_start_timeout"}
+
+
+@app.get("/api/router_warmup")
+async def router_warmup(rid: str, resp: Response):
+    """
+    - Record 'last used' for rid
+    - Ensure ECS service router-<rid> is running (desiredCount=1) or create it
+    - Wait until TCP :8081 on router host is reachable
+    - Return 204 (no body) so Nginx auth_request can proceed
+    Concurrent calls for the same rid wait on a single warmup.
+    """
+    _touch(rid)
+
+    # no await between lookup and insert, so this is atomic on the event loop
+    task = _warmup_inflight.get(rid)
+    if task is None:
+        task = asyncio.ensure_future(_do_warmup(rid))
+        _warmup_inflight[rid] = task
+        task.add_done_callback(lambda _t: _warmup_inflight.pop(rid, None))
+
+    # shield: a client giving up must not cancel the warmup the others are waiting on
+    status_code, body = await asyncio.shield(task)
+    resp.status_code = status_code
+    return body
 
-    resp.status_code = 504
-    return {"error": "router_start_timeout"}
+
+PBF_LIST_TTL = 60  # seconds
+_pbf_cache = {}  # (bucket, type) -> (expires_at, file_names); only successful listings
 
 
 @app.get("/s3/pbf_files")
@@ -218,16 +465,17 @@ def list_pbf_files(
     prefix = "preloaded_osm_files" if file_type == "osm" else "preloaded_drm_files"
     ext = ".osm.pbf" if file_type == "osm" else ".osm"
 
+    # the preloaded files rarely change: serve repeat listings from a short-lived cache
+    cache_key = (bucket, file_type)
+    cached = _pbf_cache.get(cache_key)
+    if cached and cached[0] > time.time():
+        return {"folder": prefix, "file_names": cached[1]}
+
     items = set()
     try:
-        token = None
-        while True:
-            kwargs = {"Bucket": bucket, "Prefix": f"{prefix}/"}
-            if token:
-                kwargs["ContinuationToken"] = token
-            resp = s3.list_objects_v2(**kwargs)
-
-            for obj in resp.get("Contents", []):
+        paginator = _s3().get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=bucket, Prefix=f"{prefix}/"):
+            for obj in page.get("Contents", []):
                 key = obj["Key"]
 
                 if not key.lower().endswith(ext):
@@ -237,19 +485,16 @@ def list_pbf_files(
                 if base:
                     items.add(base)
 
-            if resp.get("IsTruncated"):
-                token = resp.get("NextContinuationToken")
-            else:
-                break
-
-    except s3.exceptions.NoSuchBucket:
+    except _s3().exceptions.NoSuchBucket:
         raise HTTPException(status_code=404, detail=f"Bucket '{bucket}' not found")
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+    file_names = sorted(items)
+    _pbf_cache[cache_key] = (time.time() + PBF_LIST_TTL, file_names)
     return {
         "folder": prefix,
-        "file_names": sorted(items),
+        "file_names": file_names,
     }
 
 
@@ -266,7 +511,10 @@ async def build_graph(
     gtfs_file: UploadFile = File(...),
     graph_type: Literal["osm", "drm"] = Form("osm")
 ):
-    """Synchronous: build Graph.obj in a one-off task, then bring up router service and route traffic."""
+    """
+    Start building Graph.obj in a one-off task and return 202 right away.
+    Poll the returned status_url; the router service is brought up once the build succeeds.
+    """
     _require(GRAPHS_BUCKET, "GRAPHS_BUCKET not set")
     _require(ECS_CLUSTER_ARN and ECS_SUBNETS and ECS_SGS, "ECS cluster/subnets/SGs not set")
     _require(CLOUDMAP_NAMESPACE_ID, "Cloud Map namespace not set")
@@ -286,40 +534,82 @@ async def build_graph(
 
     # Upload GTFS to s3://bucket/gtfs/<scenario>-<type>/<filename>
     gtfs_key = f"gtfs/{graph_id}/{gtfs_file.filename}"
-    s3.upload_fileobj(gtfs_file.file, GRAPHS_BUCKET, gtfs_key)
-
-    # Run builder task and wait
-    print("[builder] submit_builder_and_wait: ENTER")
-    ok, tail = submit_builder_and_wait(
-        region=AWS_REGION,
-        cluster_arn=ECS_CLUSTER_ARN,
-        subnets=ECS_SUBNETS,
-        security_groups=ECS_SGS,
-        cloudwatch_log_group=LOG_GROUP_BUILDER,
-        task_family=BUILDER_TASK_FAMILY,
-        task_exec_role_arn=TASK_EXEC_ROLE_ARN,
-        task_role_arn=TASK_ROLE_ARN,
-        image=BUILDER_IMAGE,
-        env={
-            "AWS_REGION": AWS_REGION,
-            "GRAPHS_BUCKET": GRAPHS_BUCKET,
-            "OSM_PREFIX": osm_prefix, 
-            "OSM_EXT": osm_ext, 
-            "SCENARIO_ID": graph_id,
-            "PREFECTURE": prefecture,
-            "S3_GTFS_URI": f"s3://{GRAPHS_BUCKET}/{gtfs_key}",
-            "JAVA_TOOL_OPTIONS": "-Xmx8g -XX:+UseG1GC",
-        },
+    await asyncio.to_thread(
+        _s3().upload_fileobj, gtfs_file.file, GRAPHS_BUCKET, gtfs_key, Config=_UPLOAD_CFG
+    )
+
+    # Start the builder task; /build_status/<job_id> reports progress and brings up the router
+    try:
+        task_arn, _ = await asyncio.to_thread(
+            submit_builder,
+            region=AWS_REGION,
+            cluster_arn=ECS_CLUSTER_ARN,
+            subnets=ECS_SUBNETS,
+            security_groups=ECS_SGS,
+            cloudwatch_log_group=LOG_GROUP_BUILDER,
+            task_family=BUILDER_TASK_FAMILY,
+            task_exec_role_arn=TASK_EXEC_ROLE_ARN,
+            task_role_arn=TASK_ROLE_ARN,
+            image=BUILDER_IMAGE,
+            env={
+                "AWS_REGION": AWS_REGION,
+                "GRAPHS_BUCKET": GRAPHS_BUCKET,
+                "OSM_PREFIX": osm_prefix,
+                "OSM_EXT": osm_ext,
+                "SCENARIO_ID": graph_id,
+                "PREFECTURE": prefecture,
+                "S3_GTFS_URI": f"s3://{GRAPHS_BUCKET}/{gtfs_key}",
+                "JAVA_TOOL_OPTIONS": "-Xmx8g -XX:+UseG1GC",
+            },
+        )
+    except (RuntimeError, ClientError) as e:
+        print("[builder] submit_builder failed:", repr(e))
+        raise HTTPException(status_code=500, detail=f"Graph build submit failed: {e}")
+
+    # the ECS task id is the job id; /build_status reads everything else back from the task
+    job_id = task_arn.rpartition("/")[2]
+    print(f"[builder] submitted job_id={job_id} graph_id={graph_id}")
+    return JSONResponse(
+        status_code=202,
+        content={"status": "building", "job_id": job_id, "status_url": f"/build_status/{job_id}"},
     )
-    print(f"[builder] submit_builder_and_wait: EXIT ok={ok}")
-    if not ok:
-        # include last lines for debugging
-        raise HTTPException(status_code=500, detail="Graph build failed")
 
-    # Ensure router service is running (DEBUG logs)
-    print(f"[router] calling ensure_router_service for scenario_id={scenario_id}")
+
+def _deployed_since(svc: dict, built_at) -> bool:
+    # the service's current deployment was made after the build stopped, i.e. for this build or a later one
+    primary = next((d for d in svc.get("deployments", []) if d.get("status") == "PRIMARY"), None)
+    return bool(built_at and primary and primary.get("createdAt") and primary["createdAt"] >= built_at)
+
+
+def _graph_exists(graph_id: str) -> bool:
+    resp = _s3().list_objects_v2(Bucket=GRAPHS_BUCKET, Prefix=f"graphs/{graph_id}/", MaxKeys=1)
+    return resp.get("KeyCount", 0) > 0
+
+
+async def _finish_build(graph_id: str, built_at) -> str:
+    """
+    Bring up the router service for a graph built at 'built_at' and route traffic to it.
+    Runs once per build: later polls only see that the service was deployed since, so they
+    neither restart it nor scale up a router the idle reaper stopped, and a graph deleted
+    after its build is not brought back.
+    """
+    service_name = _service_name(graph_id)
+    svcs = (await asyncio.to_thread(
+        _ecs().describe_services, cluster=ECS_CLUSTER_ARN, services=[service_name]
+    ))["services"]
+    svc = next((x for x in svcs if x.get("status") != "INACTIVE"), None)
+    if svc is not None and _deployed_since(svc, built_at):
+        if not os.path.exists(f"{SNIPPETS_DIR}/{graph_id}.conf"):
+            dns = await asyncio.to_thread(router_dns_name, AWS_REGION, CLOUDMAP_NAMESPACE_ID, service_name)
+            await asyncio.to_thread(_write_nginx_snippet, graph_id, dns, 8081)
+        return f"/router/{graph_id}/"
+    if svc is None and not await asyncio.to_thread(_graph_exists, graph_id):
+        raise HTTPException(status_code=410, detail=f"Graph '{graph_id}' was deleted after this build")
+
+    print(f"[router] calling ensure_router_service for scenario_id={graph_id}")
     try:
-        dns = ensure_router_service(
+        dns = await asyncio.to_thread(
+            ensure_router_service,
             region=AWS_REGION,
             cluster_arn=ECS_CLUSTER_ARN,
             subnets=ECS_SUBNETS,
@@ -331,11 +621,7 @@ async def build_graph(
             task_exec_role_arn=TASK_EXEC_ROLE_ARN,
             task_role_arn=TASK_ROLE_ARN,
             image=ROUTER_IMAGE,
-            env={
-                "AWS_REGION": AWS_REGION,
-                "GRAPHS_BUCKET": GRAPHS_BUCKET,
-                "GRAPH_SCENARIO_ID": graph_id,
-            },
+            env=_router_env(graph_id),
             desired_count=1,
             container_port=8081,
             cw_log_group=LOG_GROUP_ROUTER,
@@ -351,9 +637,89 @@ async def build_graph(
     print(f"[router] ensure_router_service OK; dns={dns}")
 
     # Add nginx route (hot-reload sidecar handles reload)
-    _write_nginx_snippet(graph_id, dns, 8081)
+    await asyncio.to_thread(_write_nginx_snippet, graph_id, dns, 8081)
+    return f"/router/{graph_id}/"
 
-    return {"status": "success", "router_path": f"/router/{graph_id}/"}
+
+BUILD_STATUS_MAX_WAIT = 60  # seconds a /build_status long-poll may be held open
+# ECS task ids: 32 hex digits (or a UUID for tasks from before the long ARN format)
+_TASK_ID_RE = re.compile(r"[0-9a-f]{32}|[0-9a-f]{8}(-[0-9a-f]{4}){3}-[0-9a-f]{12}")
+
+
+def _prefer_wait(prefer: Optional[str]) -> int:
+    # RFC 7240 "Prefer: wait=N"
+    for part in (prefer or "").split(","):
+        name, _, value = part.strip().partition("=")
+        if name.strip().lower() == "wait" and value.strip().isdigit():
+            return int(value.strip())
+    return 0
+
+
+@app.get("/build_status/{job_id}")
+async def build_status(
+    job_id: str,
+    wait: int = Query(0, ge=0),
+    prefer: Optional[str] = Header(None),
+):
+    """
+    Builder progress; once it exits 0, the router is brought up (once per build) and its path returned.
+    With ?wait=N (or "Prefer: wait=N") the request is held for up to N seconds
+    (max BUILD_STATUS_MAX_WAIT) and answered as soon as the builder stops.
+    """
+    _require(
+        ECS_CLUSTER_ARN and ECS_CLUSTER_ARN.startswith("arn:") and ":cluster/" in ECS_CLUSTER_ARN,
+        "ECS_CLUSTER_ARN not set to a cluster ARN",
+    )
+    missing = JSONResponse(
+        status_code=404,
+        content={"status": "missing", "job_id": job_id, "detail": f"Unknown or expired build job '{job_id}'"},
+    )
+    if not _TASK_ID_RE.fullmatch(job_id):
+        return missing
+
+    # stateless: any worker can answer, the task (and its SCENARIO_ID override) lives in ECS
+    task_arn = f"{ECS_CLUSTER_ARN.replace(':cluster/', ':task/', 1)}/{job_id}"
+    deadline = time.time() + min(wait or _prefer_wait(prefer), BUILD_STATUS_MAX_WAIT)
+    while True:
+        try:
+            st = await asyncio.to_thread(
+                get_task_status, region=AWS_REGION, cluster_arn=ECS_CLUSTER_ARN, task_arn=task_arn
+            )
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") != "InvalidParameterException":
+                raise
+            return missing
+        remaining = deadline - time.time()
+        if st["status"] in ("STOPPED", "MISSING") or remaining <= 0:
+            break
+        await asyncio.sleep(min(2.0, remaining))
+
+    if st["status"] == "MISSING":
+        # unknown id, or ECS has already forgotten the stopped task: nothing more will change
+        return missing
+    if st["status"] != "STOPPED":
+        return {"status": "building", "job_id": job_id, "task_status": st["status"]}
+    if st["exit_code"] != 0:
+        return {
+            "status": "failed",
+            "job_id": job_id,
+            "exit_code": st["exit_code"],
+            "stopped_reason": st["stopped_reason"],
+        }
+
+    graph_id = st["env"].get("SCENARIO_ID")
+    if not graph_id:
+        raise HTTPException(status_code=404, detail=f"'{job_id}' is not a graph build job")
+
+    # concurrent polls share one bring-up; dropped when done, so a failure is retried by the
+    # next poll, and finished builds hold no memory (_finish_build itself runs once per build)
+    task = _finish_inflight.get(job_id)
+    if task is None:
+        task = asyncio.ensure_future(_finish_build(graph_id, st["stopped_at"]))
+        _finish_inflight[job_id] = task
+        task.add_done_callback(lambda _t: _finish_inflight.pop(job_id, None))
+    router_path = await asyncio.shield(task)
+    return {"status": "success", "job_id": job_id, "router_path": router_path}
 
 
 @app.post("/delete_graph")
@@ -364,17 +730,30 @@ async def delete_graph(scenario_id: str = Form(...)):
         f"router-{scenario_id}-osm",    # OSM variant
         f"router-{scenario_id}-drm",    # DRM variant
     ]
-    for svc in svc_names:
-        try:
-            delete_router_service(
-                region=AWS_REGION,
-                cluster_arn=ECS_CLUSTER_ARN,
-                service_name=svc,
-            )
-        except Exception as e:
-            print(f"[delete_graph] delete_router_service({svc}) warning: {e}")
+    results = await asyncio.gather(*(
+        asyncio.to_thread(
+            delete_router_service,
+            region=AWS_REGION,
+            cluster_arn=ECS_CLUSTER_ARN,
+            service_name=svc,
+        )
+        for svc in svc_names
+    ), return_exceptions=True)
+    for svc, res in zip(svc_names, results):
+        if isinstance(res, Exception):
+            print(f"[delete_graph] delete_router_service({svc}) warning: {res}")
 
-    # 2) Remove any nginx snippets
+    # 2) Forget their hits, so no worker tries to scale them down later
+    for name in [scenario_id, f"{scenario_id}-osm", f"{scenario_id}-drm"]:
+        _last_hit.pop(name, None)
+        _last_persisted.pop(name, None)
+    if LAST_HIT_TABLE:
+        await asyncio.gather(*(
+            asyncio.to_thread(_forget_hit, name)
+            for name in [scenario_id, f"{scenario_id}-osm", f"{scenario_id}-drm"]
+        ))
+
+    # 3) Remove any nginx snippets
     for name in [scenario_id, f"{scenario_id}-osm", f"{scenario_id}-drm"]:
         try:
             os.remove(f"{SNIPPETS_DIR}/{name}.conf")
@@ -383,19 +762,22 @@ async def delete_graph(scenario_id: str = Form(...)):
         except Exception as e:
             print(f"[delete_graph] remove snippet {name}.conf warning: {e}")
 
-    # 3) Purge S3 artifacts for all possible prefixes
+    # 4) Purge S3 artifacts for all possible prefixes
     _require(GRAPHS_BUCKET, "GRAPHS_BUCKET not set")
     prefixes = []
     for base in [scenario_id, f"{scenario_id}-osm", f"{scenario_id}-drm"]:
         prefixes.append(f"graphs/{base}/")
         prefixes.append(f"gtfs/{base}/")
 
-    deleted = {}
-    for p in prefixes:
-        try:
-            deleted[p] = _delete_prefix(GRAPHS_BUCKET, p)
-        except Exception as e:
-            deleted[p] = {"error": str(e)}
+    # independent prefixes: purge them all at once
+    results = await asyncio.gather(
+        *(asyncio.to_thread(_delete_prefix, GRAPHS_BUCKET, p) for p in prefixes),
+        return_exceptions=True,
+    )
+    deleted = {
+        p: {"error": str(res)} if isinstance(res, Exception) else res
+        for p, res in zip(prefixes, results)
+    }
 
     return {"status": "success", "deleted": deleted}
 
@@ -405,24 +787,75 @@ async def _idle_reaper_loop():
     while True:
         try:
             now = time.time()
-            stale = [rid for rid, ts in _last_hit.items() if now - ts > IDLE_SECS]
-            for rid in stale:
-                svc = f"router-{rid}"
-                print(f"[idle-reaper] scaling down {svc}")
-                try:
-                    ecs.update_service(
-                        cluster=ECS_CLUSTER_ARN,
-                        service=svc,
-                        desiredCount=0,
-                    )
-                except Exception as e:
-                    print(f"[idle-reaper] update_service({svc}) failed: {e}")
-                _last_hit.pop(rid, None)
+            refreshed = False
+            # _last_hit is least-recently-hit first: only the stale head is visited
+            while _last_hit:
+                rid, ts = next(iter(_last_hit.items()))
+                if now - ts <= IDLE_SECS:
+                    break
+                _last_hit.popitem(last=False)
+                if LAST_HIT_TABLE:
+                    # another worker may have served this router since our last hit
+                    try:
+                        shared = await asyncio.to_thread(_shared_last_hit, rid)
+                    except Exception as e:
+                        # another worker may still be serving it: put it back and ask again in a minute
+                        print(f"[idle-reaper] get_item({rid}) failed, retrying later: {e}")
+                        if rid not in _last_hit:
+                            _last_hit[rid] = now - IDLE_SECS + 60
+                            refreshed = True
+                        continue
+                    if shared is not None and now - shared <= IDLE_SECS:
+                        _last_hit[rid] = shared
+                        refreshed = True
+                        continue
+                if rid in _last_hit:
+                    continue  # hit again while we were asking the table: not idle
+                _last_persisted.pop(rid, None)
+                await _begin_scale_down(rid)
+            if refreshed:
+                # keep least-recently-hit first, which the wake-up calculation below relies on
+                for rid, _ in sorted(_last_hit.items(), key=lambda kv: kv[1]):
+                    _last_hit.move_to_end(rid)
         except Exception as e:
             print("[idle-reaper] loop error:", e)
 
-        await asyncio.sleep(60)  # check every minute
+        # Hits only push expiries later, so nothing can go idle before the oldest entry does;
+        # with no entries, nothing can expire within IDLE_SECS.
+        oldest = next(iter(_last_hit.values()), None)
+        next_expiry = (oldest + IDLE_SECS if oldest is not None else time.time() + IDLE_SECS)
+        await asyncio.sleep(max(5.0, next_expiry - time.time()))
+
+# Threads behind asyncio.to_thread/run_in_executor. Warmups, builds and ensure_router_service
+# each hold one for up to minutes, so the stock min(32, cpu+4) pool would queue everything else.
+AWS_THREADS = int(os.getenv("AWS_THREADS", "64"))
+
+@app.on_event("startup")
+async def _size_default_executor():
+    # registered first: the hooks below already run blocking calls in this pool
+    asyncio.get_running_loop().set_default_executor(
+        ThreadPoolExecutor(max_workers=AWS_THREADS, thread_name_prefix="aws")
+    )
 
 @app.on_event("startup")
 async def _start_idle_reaper():
+    if LAST_HIT_TABLE:
+        # pick up routers that other workers (or this one, before a restart) are tracking
+        try:
+            hits = await asyncio.to_thread(_load_last_hits)
+            for rid, ts in sorted(hits.items(), key=lambda kv: kv[1]):
+                _last_hit[rid] = ts
+        except Exception as e:
+            print("[startup] loading last hits failed:", repr(e))
     asyncio.create_task(_idle_reaper_loop())
+
+@app.on_event("startup")
+async def _ensure_snippets_dir():
+    os.makedirs(SNIPPETS_DIR, exist_ok=True)
+
+@app.on_event("startup")
+async def _warm_aws_clients():
+    try:
+        await asyncio.to_thread(warm_clients, AWS_REGION)
+    except Exception as e:
+        print("[startup] warm_clients failed:", repr(e))
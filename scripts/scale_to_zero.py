@@ -1,29 +1,54 @@
-import boto3, time
+import boto3, os, time
+from concurrent.futures import ThreadPoolExecutor
 
 REGION  = "ap-northeast-1"
 CLUSTER = "mobilys-otp-staging-cluster"
-PREFIX  = "otp-router-"
+PREFIX  = "router-"  # app.main._service_name: router-<rid>
 IDLE_AFTER_SEC = 1800  # 30 minutes
 
+# DynamoDB table the API records router hits in (see LAST_HIT_TABLE in app/main.py)
+LAST_HIT_TABLE = os.getenv("LAST_HIT_TABLE") or None
+
 ecs = boto3.client("ecs", region_name=REGION)
+ddb = boto3.client("dynamodb", region_name=REGION)
 
 def last_used(service_name: str) -> float:
-    # TODO: integrate with your access logs/metrics to return last-use epoch per scenario
-    return 0.0
+    """Last hit (epoch seconds) recorded in LAST_HIT_TABLE for a router service; 0.0 if none."""
+    rid = service_name[len(PREFIX):]
+    item = ddb.get_item(
+        TableName=LAST_HIT_TABLE, Key={"rid": {"S": rid}}, ConsistentRead=True
+    ).get("Item")
+    return float(item["ts"]["N"]) if item else 0.0
+
+def _scale_to_zero(name: str) -> None:
+    ecs.update_service(cluster=CLUSTER, service=name, desiredCount=0)
+    print(f"Scaled {name} → 0")
 
 def handler(event=None, context=None):
+    """
+    Scale router services idle for IDLE_AFTER_SEC to 0. Needs LAST_HIT_TABLE: without it
+    there is no record of use, so nothing is scaled down.
+    """
+    if not LAST_HIT_TABLE:
+        print("LAST_HIT_TABLE not set; not scaling anything down")
+        return
+    now = time.time()
+    stale = []
     paginator = ecs.get_paginator("list_services")
     for page in paginator.paginate(cluster=CLUSTER):
         arns = page.get("serviceArns", [])
-        if not arns: 
-            continue
-        desc = ecs.describe_services(cluster=CLUSTER, services=arns)["services"]
-        for s in desc:
-            name = s["serviceName"]
-            if not name.startswith(PREFIX): 
-                continue
-            if s.get("desiredCount", 0) == 0:
-                continue
-            if time.time() - last_used(name) > IDLE_AFTER_SEC:
-                ecs.update_service(cluster=CLUSTER, service=name, desiredCount=0)
-                print(f"Scaled {name} → 0")
+        # describe_services takes at most 10 services per call
+        for i in range(0, len(arns), 10):
+            desc = ecs.describe_services(cluster=CLUSTER, services=arns[i:i + 10])["services"]
+            for s in desc:
+                name = s["serviceName"]
+                if not name.startswith(PREFIX): 
+                    continue
+                if s.get("desiredCount", 0) == 0:
+                    continue
+                if now - last_used(name) > IDLE_AFTER_SEC:
+                    stale.append(name)
+
+    # boto3 clients are thread-safe; scale the idle services down concurrently
+    with ThreadPoolExecutor(max_workers=20) as ex:
+        list(ex.map(_scale_to_zero, stale))